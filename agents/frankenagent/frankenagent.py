@@ -1,14 +1,14 @@
 import logging
-import random
+import os
 from random import randint
 from time import time
 from typing import cast
-from decimal import Decimal
+
+import numpy as np
 from geniusweb.actions.Accept import Accept
 from geniusweb.actions.Action import Action
 from geniusweb.actions.Offer import Offer
 from geniusweb.actions.PartyId import PartyId
-from geniusweb.bidspace.AllBidsList import AllBidsList
 from geniusweb.inform.ActionDone import ActionDone
 from geniusweb.inform.Finished import Finished
 from geniusweb.inform.Inform import Inform
@@ -21,16 +21,29 @@ from geniusweb.party.DefaultParty import DefaultParty
 from geniusweb.profile.utilityspace.LinearAdditiveUtilitySpace import (
     LinearAdditiveUtilitySpace,
 )
-from geniusweb.profileconnection.ProfileConnectionFactory import (
-    ProfileConnectionFactory,
-)
 from geniusweb.progress.ProgressTime import ProgressTime
 from geniusweb.references.Parameters import Parameters
 from tudelft_utilities_logging.ReportToLogger import ReportToLogger
 
+from .utils.bid_space import flat_value_matrix, index_values
 from .utils.opponent_model import OpponentModel
 
 
+def _score(
+    progress: float,
+    our_utility: float,
+    opponent_utility: float,
+    alpha: float,
+    eps: float,
+) -> float:
+    """Arithmetic kernel of FrankenAgent.score_bid, operating on plain floats only."""
+    time_pressure = 1.0 - progress ** (1.0 / eps)
+    score = alpha * time_pressure * our_utility
+    score += (1.0 - alpha * time_pressure) * opponent_utility
+
+    return score
+
+
 class FrankenAgent(DefaultParty):
     """
     Template of a Python geniusweb agent.
@@ -38,7 +51,8 @@ class FrankenAgent(DefaultParty):
 
     def __init__(self):
         super().__init__()
-        self.getReporter().log(logging.INFO, "party is initialized")
+        self.logger: ReportToLogger = self.getReporter()
+        self.logger.log(logging.INFO, "party is initialized")
 
         self.domain: Domain = None
         self.parameters: Parameters = None
@@ -48,65 +62,134 @@ class FrankenAgent(DefaultParty):
         self.other: str = None
         self.settings: Settings = None
         self.storage_dir: str = None
+        self._data_path: bytes = None
 
         self.last_received_bid: Bid = None
+        self._cur_progress: float = 0.0
+        self._num_bids: int = 0
+        self._bids: list[Bid] = None
+        self._value_indices: dict = None
+        self._flat_bid_values: np.ndarray = None
+        self._utils: np.ndarray = None
+        self._mask_buf: np.ndarray = None
+        self._rng = np.random.default_rng()
         self.opponent_model: OpponentModel = None
 
+        # float utilities of bids seen so far, the profile does not change during a session
+        self._util_cache: dict[Bid, float] = {}
+
+        # handler per type of Inform message, see notifyChange
+        self._dispatch = {
+            Settings: self._on_settings,
+            ActionDone: self._on_action_done,
+            YourTurn: self._on_your_turn,
+            Finished: self._on_finished,
+        }
+
     def notifyChange(self, data: Inform):
         """MUST BE IMPLEMENTED
         This is the entry point of all interaction with your agent after is has been initialised.
-        How to handle the received data is based on its class type.
+        How to handle the received data is based on its class type, the handler
+        for every type is looked up in self._dispatch. Subclasses of those types
+        fall back to an isinstance check.
 
         Args:
             info (Inform): Contains either a request for action or information.
         """
+        handler = self._dispatch.get(type(data))
+        if handler is None:
+            handler = next(
+                (h for t, h in self._dispatch.items() if isinstance(data, t)), None
+            )
+
+        if handler is None:
+            self.logger.log(logging.WARNING, "Ignoring unknown info " + str(data))
+        else:
+            handler(data)
+
+    def _on_settings(self, data: Settings):
+        """A Settings message is the first message that will be send to your
+        agent containing all the information about the negotiation session.
+        """
+        self.settings = cast(Settings, data)
+        self.me = self.settings.getID()
 
-        # a Settings message is the first message that will be send to your
-        # agent containing all the information about the negotiation session.
-        if isinstance(data, Settings):
-            self.settings = cast(Settings, data)
-            self.me = self.settings.getID()
+        # progress towards the deadline has to be tracked manually through the use of the Progress object
+        self.progress = self.settings.getProgress()
 
-            # progress towards the deadline has to be tracked manually through the use of the Progress object
-            self.progress = self.settings.getProgress()
+        self.parameters = self.settings.getParameters()
+        self.storage_dir = self.parameters.get("storage_dir")
+        if self.storage_dir is not None:
+            self._data_path = os.path.join(self.storage_dir, "data.md").encode()
 
-            self.parameters = self.settings.getParameters()
-            self.storage_dir = self.parameters.get("storage_dir")
+        # only needed once per session, so imported here to keep agent start-up fast
+        from geniusweb.bidspace.AllBidsList import AllBidsList
+        from geniusweb.profileconnection.ProfileConnectionFactory import (
+            ProfileConnectionFactory,
+        )
 
-            # the profile contains the preferences of the agent over the domain
-            profile_connection = ProfileConnectionFactory.create(
-                data.getProfile().getURI(), self.getReporter()
-            )
-            self.profile = profile_connection.getProfile()
-            self.domain = self.profile.getDomain()
-            profile_connection.close()
-
-        # ActionDone informs you of an action (an offer or an accept)
-        # that is performed by one of the agents (including yourself).
-        elif isinstance(data, ActionDone):
-            action = cast(ActionDone, data).getAction()
-            actor = action.getActor()
-
-            # ignore action if it is our action
-            if actor != self.me:
-                # obtain the name of the opponent, cutting of the position ID.
+        # the profile contains the preferences of the agent over the domain
+        profile_connection = ProfileConnectionFactory.create(
+            data.getProfile().getURI(), self.getReporter()
+        )
+        self.profile = profile_connection.getProfile()
+        self.domain = self.profile.getDomain()
+        profile_connection.close()
+
+        # the bid space is fixed for the whole session, so enumerate it only once
+        all_bids = AllBidsList(self.domain)
+        self._num_bids = all_bids.size()
+        self._bids = [all_bids.get(i) for i in range(self._num_bids)]
+
+        # encode the bid space as a (bids x issues) matrix of flat value indices, so
+        # the utility of every bid can be computed with a few array operations. The
+        # value ordering and the matrix are shared with the opponent model
+        self._value_indices = index_values(self.domain)
+        self._flat_bid_values = flat_value_matrix(self._value_indices, self._bids)
+
+        # our utility of every bid, aligned with the indices of the bid space
+        self._utils = self._linear_additive_utils()
+
+        # scratch buffer for find_bid, reused every turn to avoid reallocating it
+        self._mask_buf = np.empty(self._num_bids, dtype=bool)
+
+        # build the opponent model during setup on the same value matrix, instead
+        # of on the first offer. Without offers it predicts a utility of 0 for
+        # every bid, so scores are unaffected.
+        self.opponent_model = OpponentModel(
+            self.domain, self._value_indices, self._flat_bid_values
+        )
+
+    def _on_action_done(self, data: ActionDone):
+        """ActionDone informs you of an action (an offer or an accept)
+        that is performed by one of the agents (including yourself).
+        """
+        action = cast(ActionDone, data).getAction()
+        actor = action.getActor()
+
+        # ignore action if it is our action
+        if actor != self.me:
+            # obtain the name of the opponent, cutting of the position ID.
+            # The opponent does not change during a session, so only do this once
+            if self.other is None:
                 self.other = str(actor).rsplit("_", 1)[0]
 
-                # process action done by opponent
-                self.opponent_action(action)
-        # YourTurn notifies you that it is your turn to act
-        elif isinstance(data, YourTurn):
-            # execute a turn
-            self.my_turn()
-
-        # Finished will be send if the negotiation has ended (through agreement or deadline)
-        elif isinstance(data, Finished):
-            self.save_data()
-            # terminate the agent MUST BE CALLED
-            self.logger.log(logging.INFO, "party is terminating:")
-            super().terminate()
-        else:
-            self.logger.log(logging.WARNING, "Ignoring unknown info " + str(data))
+            # process action done by opponent
+            self.opponent_action(action)
+
+    def _on_your_turn(self, data: YourTurn):
+        """YourTurn notifies you that it is your turn to act"""
+        # execute a turn
+        self.my_turn()
+
+    def _on_finished(self, data: Finished):
+        """Finished will be send if the negotiation has ended
+        (through agreement or deadline).
+        """
+        self.save_data()
+        # terminate the agent MUST BE CALLED
+        self.logger.log(logging.INFO, "party is terminating:")
+        super().terminate()
 
     def getCapabilities(self) -> Capabilities:
         """MUST BE IMPLEMENTED
@@ -127,7 +210,7 @@ class FrankenAgent(DefaultParty):
         Args:
             action (Action): action of this agent
         """
-        print("Sent action")
+        self.logger.log(logging.DEBUG, "Sent action")
         self.getConnection().send(action)
 
     # give a description of your agent
@@ -147,12 +230,8 @@ class FrankenAgent(DefaultParty):
             action (Action): action of opponent
         """
         # if it is an offer, set the last received bid
-        print("Opponent action")
+        self.logger.log(logging.DEBUG, "Opponent action")
         if isinstance(action, Offer):
-            # create opponent model if it was not yet initialised
-            if self.opponent_model is None:
-                self.opponent_model = OpponentModel(self.domain)
-
             bid = cast(Offer, action).getBid()
 
             # update opponent model with bid
@@ -165,17 +244,22 @@ class FrankenAgent(DefaultParty):
         """This method is called when it is our turn. It should decide upon an action
         to perform and send this action to the opponent.
         """
+        # progress is only read once per turn and passed on to the strategy methods
+        self._cur_progress = self.progress.get(time() * 1000)
+
         # check if the last received offer is good enough based on
         # my upcoming bid and the last received bid from opp
         bid = self.find_bid()
+        bid_utility = self._utility(bid)
 
         action = Offer(self.me, bid)
-        print("Offered a bid" + str(bid))
-        if self.accept(bid, self.last_received_bid):
+        self.logger.log(logging.DEBUG, "Offered a bid")
+        if self.accept(
+            bid_utility, self.last_received_bid, progress=self._cur_progress
+        ):
             # if so, accept the offer
             action = Accept(self.me, self.last_received_bid)
-            print("I accepted it!!!")
-            print(self.last_received_bid)
+            self.logger.log(logging.DEBUG, "Accepted offer")
 
         self.send_action(action)
 
@@ -184,9 +268,15 @@ class FrankenAgent(DefaultParty):
         for learning capabilities. Note that no extensive calculations can be done within this method.
         Taking too much time might result in your agent being killed, so use it for storage only.
         """
-        data = "Data for learning (see README.md)"
-        with open(f"{self.storage_dir}/data.md", "w") as f:
-            f.write(data)
+        if self._data_path is None:
+            return
+
+        data = b"Data for learning (see README.md)"
+        fd = os.open(self._data_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
 
     ###########################################################################################
     ################################## Example methods below ##################################
@@ -196,16 +286,23 @@ class FrankenAgent(DefaultParty):
     # Makes use of an AC_next acceptance strategy, and AC_time acceptance strategy
     # AC_const performs worst of all AC, so no point in using it
     # NOTE Modified
-    def accept(self, my_upcoming_bid: Bid, opponent_offer: Bid, T=0.95) -> bool:
+    def accept(
+        self,
+        my_upcoming_utility: float,
+        opponent_offer: Bid,
+        T=0.95,
+        progress: float = None,
+    ) -> bool:
         if opponent_offer is None:
             return False
 
-        progress = self.progress.get(time() * 1000)
+        if progress is None:
+            progress = self.progress.get(time() * 1000)
 
         # Create accept conditions, either AC_next or AC_time has to be satisfied
-        accept_condition = self.profile.getUtility(
-            opponent_offer
-        ) > self.profile.getUtility(my_upcoming_bid) or (progress > T)
+        accept_condition = self._utility(opponent_offer) > my_upcoming_utility or (
+            progress > T
+        )
 
         return accept_condition
 
@@ -224,42 +321,84 @@ class FrankenAgent(DefaultParty):
         #     if bid_score > best_bid_score:
         #         best_bid_score, best_bid = bid_score, bid
         # return best_bid
-        # Get the utility of the agent's previous offer
-        previous_offer_utility = self.profile.getUtility(self.last_received_bid)
+        # Get the utility of the agent's previous offer, minus the allowed concession.
+        # This is a plain float, so the comparison below never touches Decimal
+        min_utility = self._utility(self.last_received_bid) - 0.9
 
-        # Compose a list of all possible bids
-        domain = self.profile.getDomain()
-        all_bids = AllBidsList(domain)
+        # Select all bids that have similar utility with a minimal concession
+        np.greater(self._utils, min_utility, out=self._mask_buf)
+        candidates = np.flatnonzero(self._mask_buf)
 
-        # Determine the number of bids available
-        num_bids = all_bids.size()
+        # If no bids with similar utility, choose randomly from all possible bids
+        if candidates.size == 0:
+            return self._bids[self._rng.integers(self._num_bids)]
+
+        # Keep only the best candidates for us
+        top_k = 500
+        if candidates.size > top_k:
+            best = np.argpartition(self._utils[candidates], -top_k)[-top_k:]
+            candidates = candidates[best]
+
+        # Choose randomly from the candidates, favouring bids the opponent likes
+        opponent_utilities = self.opponent_model.predicted_utils[candidates]
+        total_opponent_utility = opponent_utilities.sum()
+        if total_opponent_utility > 0:
+            index = self._rng.choice(
+                candidates, p=opponent_utilities / total_opponent_utility
+            )
+        else:
+            index = self._rng.choice(candidates)
 
-        # Randomly select a subset of indices from the entire set of bids
-        max_bids_to_check = 500
-        random_indices = random.sample(
-            range(num_bids), min(num_bids, max_bids_to_check)
-        )
+        return self._bids[index]
 
-        # Initialize a list to store similar bids with concession
-        similar_bids_with_concession = []
+    def _linear_additive_utils(self) -> np.ndarray:
+        """Utility of every bid in the bid space, computed from the issue weights and
+        value utilities of the profile instead of evaluating each bid separately.
 
-        # Iterate through randomly selected indices and retrieve the corresponding bids
-        for index in random_indices:
-            bid = all_bids.get(index)
-            bid_utility = self.profile.getUtility(bid)
+        Returns:
+            np.ndarray: float32 utilities, aligned with the indices of the bid space
+        """
+        weights = self.profile.getWeights()
+        value_set_utilities = self.profile.getUtilities()
 
-            # Check if the bid has similar utility with a minimal concession
-            if bid_utility > previous_offer_utility - Decimal(0.9):
-                similar_bids_with_concession.append(bid)
+        # weighted utility of every value of every issue in one flat array
+        weighted_value_utilities = []
+        for issue, value_index in self._value_indices.items():
+            value_utilities = np.zeros(len(value_index))
+            for value, i in value_index.items():
+                value_utilities[i] = float(value_set_utilities[issue].getUtility(value))
 
-        # If no bids with similar utility, choose randomly from all possible bids
-        if not similar_bids_with_concession:
-            return random.choice(all_bids)
+            weighted_value_utilities.append(float(weights[issue]) * value_utilities)
+
+        # gather the value utilities of every bid and sum them over the issues
+        utils = np.concatenate(weighted_value_utilities)[self._flat_bid_values].sum(
+            axis=1
+        )
+
+        return utils.astype(np.float32)
 
-        # Choose randomly from similar bids with concession
-        return random.choice(similar_bids_with_concession)
+    def _utility(self, bid: Bid) -> float:
+        """Utility of a bid for this agent as a float, memoized per bid
 
-    def score_bid(self, bid: Bid, alpha: float = 0.95, eps: float = 0.1) -> float:
+        Args:
+            bid (Bid): Bid to evaluate
+
+        Returns:
+            float: utility
+        """
+        utility = self._util_cache.get(bid)
+        if utility is None:
+            utility = float(self.profile.getUtility(bid))
+            self._util_cache[bid] = utility
+        return utility
+
+    def score_bid(
+        self,
+        bid: Bid,
+        alpha: float = 0.95,
+        eps: float = 0.1,
+        progress: float = None,
+    ) -> float:
         """Calculate heuristic score for a bid
 
         Args:
@@ -268,20 +407,18 @@ class FrankenAgent(DefaultParty):
                 altruistic behaviour. Defaults to 0.95.
             eps (float, optional): Time pressure factor, balances between conceding
                 and Boulware behaviour over time. Defaults to 0.1.
+            progress (float, optional): Progress towards the deadline, read from the
+                Progress object when not given. Defaults to None.
 
         Returns:
             float: score
         """
-        progress = self.progress.get(time() * 1000)
-
-        our_utility = float(self.profile.getUtility(bid))
+        if progress is None:
+            progress = self.progress.get(time() * 1000)
 
-        time_pressure = 1.0 - progress ** (1 / eps)
-        score = alpha * time_pressure * our_utility
+        our_utility = self._utility(bid)
 
-        if self.opponent_model is not None:
-            opponent_utility = self.opponent_model.get_predicted_utility(bid)
-            opponent_score = (1.0 - alpha * time_pressure) * opponent_utility
-            score += opponent_score
+        # an opponent model without offers predicts 0, leaving only our own utility
+        opponent_utility = self.opponent_model.get_predicted_utility(bid)
 
-        return score
+        return _score(progress, our_utility, opponent_utility, alpha, eps)
@@ -0,0 +1,45 @@
+import numpy as np
+from geniusweb.issuevalue.Bid import Bid
+from geniusweb.issuevalue.Domain import Domain
+
+
+def index_values(domain: Domain) -> dict:
+    """Assign a stable index to every value of every issue of the domain. Issues are
+    ordered as in Domain.getIssuesValues(), values as in their DiscreteValueSet.
+    This is the single definition of the value ordering used by the flat value matrix.
+
+    Args:
+        domain (Domain): Domain with discrete issues only
+
+    Returns:
+        dict: value index per value, per issue
+    """
+    return {
+        issue: {value: i for i, value in enumerate(value_set.getValues())}
+        for issue, value_set in domain.getIssuesValues().items()
+    }
+
+
+def flat_value_matrix(value_indices: dict, bids: list[Bid]) -> np.ndarray:
+    """Encode a list of bids as a (bids x issues) matrix of indices into a single flat
+    array holding the values of all issues one after another, in the order of
+    value_indices. The shape of the domain is fixed for a session, so this is done
+    once and every utility of the bid space becomes one gather and one sum.
+
+    Args:
+        value_indices (dict): Value index per value, per issue, see index_values
+        bids (list[Bid]): Bids to encode
+
+    Returns:
+        np.ndarray: (bids x issues) matrix of indices into the flat value array
+    """
+    issues = list(value_indices.items())
+    num_values = [len(value_index) for _, value_index in issues]
+    offsets = np.concatenate(([0], np.cumsum(num_values)[:-1])).astype(np.intp)
+
+    values = np.empty((len(bids), len(issues)), dtype=np.intp)
+    for i, bid in enumerate(bids):
+        for j, (issue, value_index) in enumerate(issues):
+            values[i, j] = value_index[bid.getValue(issue)]
+
+    return values + offsets
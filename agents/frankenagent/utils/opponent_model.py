@@ -1,20 +1,43 @@
 from collections import defaultdict
 
+import numpy as np
 from geniusweb.issuevalue.Bid import Bid
 from geniusweb.issuevalue.DiscreteValueSet import DiscreteValueSet
 from geniusweb.issuevalue.Domain import Domain
 from geniusweb.issuevalue.Value import Value
 
+from .bid_space import index_values
+
 
 class OpponentModel:
-    def __init__(self, domain: Domain):
+    def __init__(
+        self,
+        domain: Domain,
+        value_indices: dict = None,
+        flat_bid_values: np.ndarray = None,
+    ):
         self.offers = []
         self.domain = domain
 
+        # the issue estimators follow the issue and value order of value_indices,
+        # which is also the column and value order of flat_bid_values
+        if value_indices is None:
+            value_indices = index_values(domain)
+        issues_values = domain.getIssuesValues()
         self.issue_estimators = {
-            i: IssueEstimator(v) for i, v in domain.getIssuesValues().items()
+            i: IssueEstimator(issues_values[i], value_index)
+            for i, value_index in value_indices.items()
         }
 
+        # flat value index of every issue for every bid in the bid space
+        # (bids x issues), as built by bid_space.flat_value_matrix from the same
+        # value_indices. Used to predict all bids at once
+        self._flat_bid_values = flat_bid_values
+        self._predicted_utils: np.ndarray = None
+        self._dirty = True
+        # predicted utilities of single bids, only valid until the next update
+        self._pred_cache: dict[Bid, float] = {}
+
     def update(self, bid: Bid):
         # keep track of all bids received
         self.offers.append(bid)
@@ -23,10 +46,59 @@ class OpponentModel:
         for issue_id, issue_estimator in self.issue_estimators.items():
             issue_estimator.update(bid.getValue(issue_id))
 
+        self._dirty = True
+        self._pred_cache.clear()
+
+    @property
+    def predicted_utils(self) -> np.ndarray:
+        """Predicted utility of every bid in the bid space, aligned with the rows of
+        the flat value matrix that was passed to the constructor. Rebuilt lazily
+        after updates.
+        """
+        if self._flat_bid_values is None:
+            raise ValueError("OpponentModel was created without a bid space")
+
+        if self._dirty:
+            self._predicted_utils = self._predict_all()
+            self._dirty = False
+
+        return self._predicted_utils
+
+    def _predict_all(self) -> np.ndarray:
+        num_bids = self._flat_bid_values.shape[0]
+        if len(self.offers) == 0:
+            return np.zeros(num_bids)
+
+        issue_weights = np.array(
+            [ie.weight for ie in self.issue_estimators.values()], dtype=np.float64
+        )
+
+        # normalise the issue weights such that the sum is 1.0
+        total_issue_weight = issue_weights.sum()
+        if total_issue_weight == 0.0:
+            issue_weights = np.full(len(issue_weights), 1 / len(issue_weights))
+        else:
+            issue_weights = issue_weights / total_issue_weight
+
+        # weighted utility of every value of every issue in one flat array, then
+        # gather those for every bid and sum them over the issues
+        weighted_value_utilities = np.concatenate(
+            [
+                iw * ie.get_value_utilities()
+                for iw, ie in zip(issue_weights, self.issue_estimators.values())
+            ]
+        )
+        predicted_utils = weighted_value_utilities[self._flat_bid_values].sum(axis=1)
+
+        return predicted_utils
+
     def get_predicted_utility(self, bid: Bid):
         if len(self.offers) == 0 or bid is None:
             return 0
 
+        if bid in self._pred_cache:
+            return self._pred_cache[bid]
+
         # initiate
         total_issue_weight = 0.0
         value_utilities = []
@@ -54,11 +126,12 @@ class OpponentModel:
             [iw * vu for iw, vu in zip(issue_weights, value_utilities)]
         )
 
+        self._pred_cache[bid] = predicted_utility
         return predicted_utility
 
 
 class IssueEstimator:
-    def __init__(self, value_set: DiscreteValueSet):
+    def __init__(self, value_set: DiscreteValueSet, value_index: dict):
         if not isinstance(value_set, DiscreteValueSet):
             raise TypeError(
                 "This issue estimator only supports issues with discrete values"
@@ -70,6 +143,9 @@ class IssueEstimator:
         self.value_trackers = defaultdict(ValueEstimator)
         self.weight = 0
 
+        # stable index of every value of this issue, see bid_space.index_values
+        self.value_index = value_index
+
     def update(self, value: Value):
         self.bids_received += 1
 
@@ -102,6 +178,14 @@ class IssueEstimator:
 
         return 0
 
+    def get_value_utilities(self) -> np.ndarray:
+        """Predicted utility of every value of this issue, ordered by value index"""
+        value_utilities = np.zeros(self.num_values)
+        for value, value_tracker in self.value_trackers.items():
+            value_utilities[self.value_index[value]] = value_tracker.utility
+
+        return value_utilities
+
 
 class ValueEstimator:
     def __init__(self):